@@ -4,19 +4,38 @@ import time
 import datetime
 import yaml
 import math
+import functools
 import numpy as np
+import pandas as pd
 from typing import Dict, List, Tuple
 import os
 from pathlib import Path
 
+# prefer the libyaml backed loader, pyyaml may be built without it
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+_YES_NO_COUNTERPARTS = {'No ': 'Yes ', 'Yes ': 'No '}
+_OVER_UNDER_PATTERN = re.compile(r"(Over|Under) (\d+(\.\d+)?)", re.IGNORECASE)
+_SPREAD_PATTERN = re.compile(r"(.+?)(?:\s+([+-]?\d+(?:\.\d+)?))?$")
+# odds and probabilities passed as one of these are computed element-wise, anything else takes the scalar branches
+_ARRAY_TYPES = (np.ndarray, pd.Series)
+
 def load_yaml_file(path: str) -> Dict | List | None:
     '''
     loads in the yaml file specified in the path depending on the format of the yaml, the output will be either a List or Dictonary 
+    each file is only parsed once per process, repeated loads return the same (shared) object
     '''
     
+    return _load_yaml_file_cached(str(Path(path).resolve()))
+
+@functools.lru_cache(maxsize=None)
+def _load_yaml_file_cached(path: str) -> Dict | List | None:
     with open(path, 'r') as stream:
         try:
-            config = yaml.safe_load(stream)
+            config = yaml.load(stream, Loader=_YamlLoader)
             return config
         except yaml.YAMLError as exc:
             print(exc)
@@ -26,51 +45,68 @@ def ensure_dir_exists(dir_path: str) -> str:
     '''
     checks if the directory exists and creates it if not
     '''
-    try:
-        os.makedirs(dir_path)
-        return dir_path
-    except FileExistsError:
-        return dir_path
+    Path(dir_path).mkdir(parents=True, exist_ok=True)
+    return dir_path
 
-def compute_vig_implied_probability(odds: int) -> float:
+def compute_vig_implied_probability(odds: int | np.ndarray) -> float | np.ndarray:
     '''
         computes the implied probability (with vig included) for a particular match
     '''
+    if isinstance(odds, _ARRAY_TYPES):
+        # closed form of the branches below, american odds never fall within (-100, 100)
+        odds = np.asarray(odds, dtype=np.float64)
+        return np.maximum(-odds, 100.0) / (np.abs(odds) + 100.0)
+
     # negative odds imply that you are the favourite
     if odds < 0: 
         return abs(odds) / (abs(odds) + 100)
     else:
         return 100 / (100 + odds)
 
-def compute_no_vig_probabilities(odds_team_1: int, odds_team_2: int) -> Tuple[float, float]:
+def compute_no_vig_probabilities(odds_team_1: int | np.ndarray, 
+                                 odds_team_2: int | np.ndarray) -> Tuple[float, float] | Tuple[np.ndarray, np.ndarray]:
     '''
         computes the implied fair odds (excluding the vig from the sportsbook) for a particular match 
+        passing arrays of paired odds computes the fair odds for every pair at once
     '''
     team_1_vig_incl_prob = compute_vig_implied_probability(odds_team_1)
     team_2_vig_incl_prob = compute_vig_implied_probability(odds_team_2)
 
+    # the two fair probabilities share a denominator and always sum to one
     no_vig_prob_team_1 = team_1_vig_incl_prob / (team_1_vig_incl_prob + team_2_vig_incl_prob)
-    no_vig_prob_team_2 = team_2_vig_incl_prob / (team_1_vig_incl_prob + team_2_vig_incl_prob)
+    no_vig_prob_team_2 = 1 - no_vig_prob_team_1
         
     return (no_vig_prob_team_1, no_vig_prob_team_2)
 
-def compute_return_on_bet(odds: int) -> float: 
+def compute_return_on_bet(odds: int | np.ndarray) -> float | np.ndarray:
     '''
-        computes how much a one unit bet would win if the returns hit 
+        computes how much a one unit bet would win if the returns hit
     '''
 
+    if isinstance(odds, _ARRAY_TYPES):
+        odds = np.asarray(odds, dtype=np.float64)
+        return np.maximum(odds, 100.0) / np.maximum(-odds, 100.0)
+
     # negative odds imply that you are the favourite
-    if odds < 0: 
+    if odds < 0:
         return 100 / abs(odds)
     else:
         return odds / 100
 
-def compute_positive_ev_odds(novig_prob: float) -> int:
+def compute_positive_ev_odds(novig_prob: float | np.ndarray) -> int | np.ndarray:
     '''
         computes the minumum betting threshold needed based on the novig prob for the bet to reach positive expected value
+        an array of probabilities is evaluated element-wise, a zero probability has no threshold and maps to NaN
     '''
+    if isinstance(novig_prob, _ARRAY_TYPES):
+        novig_prob = np.asarray(novig_prob, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            break_even_return = (1 - novig_prob) / novig_prob
+            positive_ev_odds = np.where(break_even_return < 1, np.ceil(-1 * 100 / break_even_return), np.ceil(break_even_return * 100))
+        return np.where(novig_prob == 0, np.nan, positive_ev_odds)
+
     if novig_prob == 0:
-        return np.NaN
+        return np.nan
     break_even_return = (1- novig_prob) / novig_prob
     if break_even_return < 1: 
         return math.ceil(-1 * 100 / break_even_return)
@@ -78,9 +114,10 @@ def compute_positive_ev_odds(novig_prob: float) -> int:
         return math.ceil(break_even_return * 100)
 
 
-def determin_arbitrage_opps(odds1: int, odds2: int) -> bool: 
+def determin_arbitrage_opps(odds1: int | np.ndarray, odds2: int | np.ndarray) -> bool | np.ndarray: 
     '''
         determines whether the pair of odds provide an arbitrage opportunity 
+        arrays of paired odds give back a boolean array, a missing counterpart (NaN) is never an arbitrage
     '''
     return compute_vig_implied_probability(odds1) + compute_vig_implied_probability(odds2) < 1
 
@@ -90,17 +127,22 @@ def determin_arbitrage_return(odds1: int, odds2: int) -> bool:
     '''
     return (1 - compute_vig_implied_probability(odds1) + compute_vig_implied_probability(odds2))
 
-def compute_expected_return(odds: int, novig_prob: float) -> float: 
+def compute_expected_return(odds: int | np.ndarray, novig_prob: float | np.ndarray) -> float | np.ndarray: 
     '''
         given the implied no vig probability and corresponding odds compute the expected return from the bet 
+        arrays of odds and probabilities are evaluated element-wise in a single pass
     '''
 
+    if isinstance(odds, _ARRAY_TYPES):
+        novig_prob = np.asarray(novig_prob, dtype=np.float64)
+        return compute_return_on_bet(odds) * novig_prob - (1 - novig_prob)
+
     if odds < 0: 
         return 100 / abs(odds) * novig_prob - (1- novig_prob)
     else:
         return odds / 100 * novig_prob - (1- novig_prob)
 
-def compute_arbitrage_optimization(odd1: int, odd2: int) -> float:
+def compute_arbitrage_optimization(odd1: int | np.ndarray, odd2: int | np.ndarray) -> Tuple[float, float] | Tuple[np.ndarray, np.ndarray]:
     '''
         computes the amount to distribute between two bets if an arbitrage opportunity exists 
         assuming betting with a single unit
@@ -111,7 +153,10 @@ def compute_arbitrage_optimization(odd1: int, odd2: int) -> float:
     allocation_odds_1 = 1 / (dec_odd1 / dec_odd2 + 1)
     return allocation_odds_1, 1 - allocation_odds_1
 
-def compute_arbitrage_profit(odd1: int, odd1_allocation: float, odd2: int, odd2_allocation: float) -> Tuple[float, float]:
+def compute_arbitrage_profit(odd1: int | np.ndarray, 
+                             odd1_allocation: float | np.ndarray, 
+                             odd2: int | np.ndarray, 
+                             odd2_allocation: float | np.ndarray) -> Tuple[float, float] | Tuple[np.ndarray, np.ndarray]:
     '''
         computes the range of profit in an arbitrage opportunity 
     '''
@@ -123,27 +168,28 @@ def compute_arbitrage_profit(odd1: int, odd1_allocation: float, odd2: int, odd2_
     profit_odd_2 = return_odd2 * odd2_allocation - odd1_allocation
     return (profit_odd_1, profit_odd_2)
 
+# the same event types and teams recur across every sportsbook and every snapshot of an event, so the parsed counterparts are kept
+@functools.lru_cache(maxsize=4096)
 def get_counter_event_name(event_type: str, 
                            home_team: str, 
                            away_team: str) -> str:
-    if event_type == 'No ':
-        return 'Yes '
-    elif event_type == 'Yes ':
-        return 'No '
+    # Yes/No markets are the most common and never need the regex work below
+    counter_event = _YES_NO_COUNTERPARTS.get(event_type)
+    if counter_event is not None:
+        return counter_event
     elif event_type == home_team + ' ':
         return away_team + ' '
     elif event_type == away_team + ' ':
         return home_team + ' '
 
     # If the event is an Over/Under type
-    match = re.match(r"(Over|Under) (\d+(\.\d+)?)", event_type, re.IGNORECASE)
+    match = _OVER_UNDER_PATTERN.match(event_type)
     if match:
         line, value = match.group(1), match.group(2)
         return f"{'Under' if line.lower() == 'over' else 'Over'} {value}"
 
     # If the event is a spread bet (Team Name +/- Points)
-    pattern = r"(.+?)(?:\s+([+-]?\d+(?:\.\d+)?))?$"  
-    match = re.match(pattern, event_type)
+    match = _SPREAD_PATTERN.match(event_type)
     if match:
         team, spread = match.group(1), float(match.group(2))  # Extract team and spread value
         counter_spread = -spread  # Flip the sign
@@ -1,21 +1,99 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+import tempfile
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import time
 import os
 import copy
+import numpy as np
 import pandas as pd
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
 from .helper import *
 from typing import Dict, List, Tuple, Union
 from pathlib import Path
 
+# prefer orjson when installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 api_source = 'https://api.the-odds-api.com/v4/sports'
+historical_api_source = 'https://api.the-odds-api.com/v4/historical/sports'
 ODDS_FORMAT = 'american' # decimal | american
 DATE_FORMAT = 'iso' # iso | unix
 SPORT = 'upcoming' # use the sport_key from the /sports endpoint below, or use 'upcoming' to see the next 8 games across all sports
 REGIONS = 'us,us2' # uk | us | us2 | eu | au Multiple can be specified if comma delimited
+REQUEST_TIMEOUT = (5, 30) # seconds to wait on the odds api to (connect, respond) before giving up on a request
+USER_AGENT = 'superodds'
+# connection failures are retried by the adapter, rate limited (429) and transient server responses by `send_request`
+# so that every attempt goes through the rate limiter
+REQUEST_RETRY = Retry(total = 5, 
+                      backoff_factor = 0.5, 
+                      status = 0,
+                      allowed_methods = ['GET'],
+                      respect_retry_after_header = False,
+                      raise_on_status = False)
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+RETRY_STATUS_ATTEMPTS = 5 # retries of a rate limited or transient server response before it is handed back as is
+RETRY_BACKOFF = 0.5 # seconds, doubled on every further attempt unless the response sends Retry-After
+RETRY_AFTER_MAX = 60 # seconds, the longest Retry-After that is honoured
 home_dir = Path(os.path.expanduser("~"))
 current_dir = Path(os.path.dirname(__file__))
+config_dir = current_dir / 'configs'
+
+def load_config(file_name: str) -> Union[Dict, List, None]:
+    '''
+    returns a private copy of a packaged config, the yaml itself is only parsed once per process (see `load_yaml_file`)
+    so every OddsAPI instance can modify its configs without leaking the change into other instances
+    '''
+    return copy.deepcopy(load_yaml_file(config_dir / file_name))
+
+def read_api_tokens(response: requests.Response) -> Tuple[str, str]:
+    '''
+    returns the (remaining, used) request quota the odds api reports on every successful response
+    '''
+    return response.headers['x-requests-remaining'], response.headers['x-requests-used']
+
+class TokenBucket:
+
+    """TokenBucket class
+
+    Paces requests to the plan's requests per minute. Tokens refill continuously at `requests_per_minute / 60` per second
+    up to `capacity`, and `acquire` blocks until a token is free. One bucket is shared by every worker thread.
+    """
+    def __init__(self,
+                 requests_per_minute: float,
+                 capacity = 1):
+        self.rate = requests_per_minute / 60
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Takes a token, sleeping until the bucket has refilled enough to cover it.
+
+        The token is reserved under the lock (the count may go negative) and the sleep happens outside it,
+        so waiting threads are released in order without polling.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        
+        if wait > 0:
+            time.sleep(wait)
 
 class OddsAPI:
     
@@ -30,16 +108,110 @@ class OddsAPI:
                  api_source = api_source,
                  odds_format = ODDS_FORMAT,
                  date_format = DATE_FORMAT,
-                 region = REGIONS):
+                 region = REGIONS,
+                 cache_ttl = None,
+                 cache_dir = None,
+                 cache_stale_on_error = True,
+                 cache_historical = False,
+                 requests_per_minute = None):
         self.api_key = api_key
         self.source = api_source
         self.odds_format = odds_format
         self.date_format = date_format
         self.region = REGIONS
-        self.league_config =  load_yaml_file(current_dir / 'configs/sports_leagues.yml')
-        self.betting_markets = load_yaml_file(current_dir / 'configs/odds_api_markets.yml')
-        self.region_books = load_yaml_file(current_dir / 'configs/market_regions.yml')
-        self.odds_set = load_yaml_file(current_dir / 'configs/odds_set.yml')
+        self.league_config = load_config('sports_leagues.yml')
+        self.betting_markets = load_config('odds_api_markets.yml')
+        self.region_books = load_config('market_regions.yml')
+        self.odds_set = load_config('odds_set.yml')
+        # the query parameters shared by every live (and every historical event) request, requests encodes them onto the url
+        self._base_params = {
+            'apiKey': self.api_key,
+            'regions': self.region,
+            'oddsFormat': self.odds_format,
+            'dateFormat': self.date_format,
+        }
+        self._historical_base_params = {
+            'apiKey': self.api_key,
+            'regions': self.region,
+            'oddsFormat': self.odds_format,
+        }
+        # a single session keeps the connection to the odds api alive across requests
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(pool_connections = 10, pool_maxsize = 20, max_retries = REQUEST_RETRY))
+        self._session.headers.update({'User-Agent': USER_AGENT})
+        # requests are paced to `requests_per_minute` across every thread (None leaves them unthrottled)
+        self.rate_limiter = TokenBucket(requests_per_minute) if requests_per_minute else None
+        # odds responses are reused for `cache_ttl` seconds (None disables the cache) and optionally persisted under `cache_dir`;
+        # expired entries are deleted when read unless `cache_stale_on_error` keeps them as a fallback, in which case the fallback is kept
+        # on disk when `cache_dir` is set (the directory is never pruned then) and in memory, one response per event and market, otherwise
+        self.cache_ttl = cache_ttl
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.cache_stale_on_error = cache_stale_on_error
+        # historical snapshots never change, so with `cache_historical` they are kept without expiry (on disk too when `cache_dir` is set)
+        self.cache_historical = cache_historical
+        self._response_cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._session.close()
+
+    def send_request(self,
+                     url: str,
+                     params: Dict) -> requests.Response:
+        for attempt in range(RETRY_STATUS_ATTEMPTS + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            
+            response = self._session.get(url, params = params, timeout = REQUEST_TIMEOUT)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == RETRY_STATUS_ATTEMPTS:
+                return response
+
+            retry_after = response.headers.get('Retry-After', '')
+            response.close()
+            time.sleep(min(float(retry_after), RETRY_AFTER_MAX) if retry_after.isdigit() else RETRY_BACKOFF * 2 ** attempt)
+
+    def read_cached_response(self,
+                             cache_key: str,
+                             max_age = None,
+                             keep_in_memory = True) -> Union[Dict, List, None]:
+        cached = self._response_cache.get(cache_key)
+        if cached is None and self.cache_dir is not None:
+            cache_path = self.cache_dir / f'{cache_key}.json'
+            try:
+                cached = (cache_path.stat().st_mtime, json_loads(cache_path.read_bytes()))
+            except FileNotFoundError:
+                pass
+            else:
+                if keep_in_memory:
+                    self._response_cache[cache_key] = cached
+        
+        if cached is not None:
+            if max_age is None or time.time() - cached[0] < max_age:
+                return cached[1]
+            # an expired entry only stays in memory when there is no cache_dir to serve the stale fallback from
+            if self.cache_dir is not None or not self.cache_stale_on_error:
+                self._response_cache.pop(cache_key, None)
+            if self.cache_dir is not None and not self.cache_stale_on_error:
+                (self.cache_dir / f'{cache_key}.json').unlink(missing_ok = True)
+
+    def write_cached_response(self,
+                              cache_key: str,
+                              response_json: Union[Dict, List],
+                              keep_in_memory = True) -> None:
+        if keep_in_memory or self.cache_dir is None:
+            self._response_cache[cache_key] = (time.time(), response_json)
+        if self.cache_dir is not None:
+            cache_path = self.cache_dir / f'{cache_key}.json'
+            # write to a uniquely named scratch file first so concurrent readers (and writers in other processes) never see a partial response
+            ensure_dir_exists(str(self.cache_dir))
+            with tempfile.NamedTemporaryFile('w', dir = self.cache_dir, suffix = '.tmp', delete = False) as scratch_file:
+                scratch_file.write(json.dumps(response_json))
+            os.replace(scratch_file.name, cache_path)
         
     def output_game_dict(self,
                          odds_response: Dict,
@@ -47,10 +219,10 @@ class OddsAPI:
                         ) -> Union[Dict, None]:
         games_dict = {}
         if not historical_ran_time:
-            historical_ran_time = datetime.datetime.now(datetime.timezone.utc)
-            # Convert to string in ISO 8601 format
-            dt_string = historical_ran_time.strftime("%Y-%m-%dT%H:%M:%SZ")
-        dt_string = historical_ran_time
+            # Convert to string in ISO 8601 format, the same form the historical snapshots carry
+            dt_string = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        else:
+            dt_string = historical_ran_time
         for item in odds_response:
             game_id = item['id']
             games_dict[game_id] = {}
@@ -75,7 +247,7 @@ class OddsAPI:
         home_team = odds_response_json['home_team']
         away_team = odds_response_json['away_team']
         bookmakers = odds_response_json['bookmakers']
-        odds_dict = {}
+        odds_dict = defaultdict(lambda: {'lines': defaultdict(dict), 'last_updated_at': None})
         for bookmaker in bookmakers:
             bookmaker_name = bookmaker['key']
             markets = bookmaker['markets']
@@ -85,23 +257,29 @@ class OddsAPI:
                 market_outcomes = market['outcomes']
                 for market_outcome in market_outcomes:
                     market_name = market_outcome['name']
-                    market_description = market_outcome['description'] if 'description' in market_outcome else ''
-                    market_point_abs = abs(market_outcome['point']) if 'point' in market_outcome else ''
-                    market_point = market_outcome['point'] if 'point' in market_outcome else ''
-                    bet_spread_name = "_".join(map(str, [market_key, 
-                                                         market_description, 
-                                                         market_point_abs]))
+                    market_description = market_outcome.get('description', '')
+                    market_point = market_outcome.get('point')
+                    if market_point is None:
+                        market_point = market_point_abs = ''
+                    else:
+                        market_point_abs = abs(market_point)
+                    bet_spread_name = f'{market_key}_{market_description}_{market_point_abs}'
                     market_price = market_outcome['price']
-                    if bet_spread_name not in odds_dict:
-                        odds_dict[bet_spread_name] = {}
-                        odds_dict[bet_spread_name]['lines'] = {}
                     market_name_for_dict = f'{market_name} {market_point}'
-                    if bookmaker_name not in odds_dict[bet_spread_name]['lines']:
-                        odds_dict[bet_spread_name]['lines'][bookmaker_name] = {}
-                    odds_dict[bet_spread_name]['last_updated_at'] = updated_time
-                    odds_dict[bet_spread_name]['lines'][bookmaker_name][market_name_for_dict] = market_price
-                    if len(odds_dict[bet_spread_name]['lines'][bookmaker_name]) > 3: 
-                        odds_dict[bet_spread_name]['lines'][bookmaker_name] = self.organize_pairs(odds_dict[bet_spread_name]['lines'][bookmaker_name])
+                    bet_spread = odds_dict[bet_spread_name]
+                    bet_spread['last_updated_at'] = updated_time
+                    bet_spread['lines'][bookmaker_name][market_name_for_dict] = market_price
+
+        # alternate lines are put back into counterpart order once, after every outcome has been collected
+        organize = self.organize_pairs
+        for bet_spread in odds_dict.values():
+            spread_lines = bet_spread['lines']
+            for bookmaker_name, bookmaker_lines in spread_lines.items():
+                if len(bookmaker_lines) > 3:
+                    spread_lines[bookmaker_name] = organize(bookmaker_lines)
+
+        # hand back plain dicts
+        odds_dict = {bet_spread_name: dict(bet_spread, lines = dict(bet_spread['lines'])) for bet_spread_name, bet_spread in odds_dict.items()}
 
         self.latest_ran_home_team = home_team
         self.latest_ran_away_team = away_team
@@ -115,197 +293,314 @@ class OddsAPI:
                              sport: str,
                             ) -> Union[Dict, None]:
 
-        url_link = f'https://api.the-odds-api.com/v4/sports/{sport}/events?apiKey={self.api_key}'
-        odds_response = requests.get(
-            url_link,
-            params={
-                'api_key': self.api_key,
-                'regions': self.region,
-                'oddsFormat': self.odds_format,
-                'dateFormat': self.date_format,
-            })
+        odds_response = self.send_request(
+            f'{self.source}/{sport}/events',
+            params = self._base_params)
         
         if odds_response.status_code != 200:
             print(f'Failed to get sports: status_code {odds_response.status_code}, response body {odds_response.text}')
         else: 
-            self.api_tokens_left = odds_response.headers['x-requests-remaining']
-            self.api_tokens_used = odds_response.headers['x-requests-used']
-            return self.output_game_dict(odds_response = odds_response.json())
+            self.update_api_tokens([read_api_tokens(odds_response)])
+            return self.output_game_dict(odds_response = json_loads(odds_response.content))
 
     def get_historical_matches(self,
                              sport: str,
                              date: str, 
                              hour_of_day = '12:00:00'
                             ) -> Union[Dict, None]:
-        historical_url_request = f'https://api.the-odds-api.com/v4/historical/sports/{sport}/odds?regions=us&oddsFormat=american&apiKey={self.api_key}&date={date}T{hour_of_day}Z'
-        odds_response = requests.get(historical_url_request)
+        odds_response_json, api_tokens = self.fetch_historical_response(
+            f'{historical_api_source}/{sport}/odds',
+            params = {
+                'apiKey': self.api_key,
+                'regions': 'us',
+                'oddsFormat': 'american',
+                'date': f'{date}T{hour_of_day}Z',
+            })
+        self.update_api_tokens([api_tokens])
         
+        if odds_response_json is not None: 
+            ran_time = f'{date}T{hour_of_day}Z'
+            self.latest_historical_ran_time = ran_time
+            return self.output_game_dict(odds_response_json['data'], historical_ran_time = ran_time)
+
+    def update_api_tokens(self,
+                          api_tokens: List[Union[Tuple[str, str], None]]) -> None:
+        # concurrent responses finish out of order, the one that has used the most requests carries the latest quota
+        api_tokens = [tokens for tokens in api_tokens if tokens is not None]
+        if api_tokens:
+            self.api_tokens_left, self.api_tokens_used = max(api_tokens, key = lambda tokens: float(tokens[1]))
+
+    def fetch_historical_response(self,
+                                  url: str,
+                                  params: Dict) -> Tuple[Union[Dict, None], Union[Tuple[str, str], None]]:
+        if self.cache_historical:
+            # the api key is left out of the key so a rotated key still hits the snapshots that were already paid for
+            cache_params = sorted((name, value) for name, value in params.items() if name != 'apiKey')
+            cache_key = hashlib.sha256(f'{url}|{json.dumps(cache_params)}'.encode()).hexdigest()
+            cached_response = self.read_cached_response(cache_key, keep_in_memory = False)
+            if cached_response is not None:
+                return cached_response, None
+
+        odds_response = self.send_request(url, params = params)
         if odds_response.status_code != 200:
             print(f'Failed to get sports: status_code {odds_response.status_code}, response body {odds_response.text}')
+            return None, None
         else: 
-            self.api_tokens_left = odds_response.headers['x-requests-remaining']
-            self.api_tokens_used = odds_response.headers['x-requests-used']
-            ran_time = f'{date}T{hour_of_day}Z'
-            self.latest_historical_ran_time = ran_time
-            return self.output_game_dict(odds_response.json()['data'], historical_ran_time = ran_time)
+            odds_response_json = json_loads(odds_response.content)
+            if self.cache_historical:
+                # a sweep touches every snapshot once, so with a cache_dir they are only kept on disk rather than piling up in memory
+                self.write_cached_response(cache_key, odds_response_json, keep_in_memory = False)
+            
+            return odds_response_json, read_api_tokens(odds_response)
 
     def organize_pairs(self,
                        lines_dict: Dict) -> Dict:
-        # Split the dictionary into keys and sort by team and point spread
-        sorted_keys = sorted(lines_dict.keys(), key=lambda x: (x.split(' ')[-1], x.split(' ')[0]))
-        sorted_keys[1], sorted_keys[3] = sorted_keys[3], sorted_keys[1]
-        
-        # Create a new dictionary to store the ordered pairs
-        organized_dict = {key: lines_dict[key] for key in sorted_keys}
-        return organized_dict
+        # Sort the lines by point spread then team (each key is split once), then swap so each line sits next to its counterpart
+        def point_then_team(line):
+            parts = line[0].split(' ')
+            return (parts[-1], parts[0])
+
+        sorted_lines = sorted(lines_dict.items(), key=point_then_team)
+        sorted_lines[1], sorted_lines[3] = sorted_lines[3], sorted_lines[1]
+        return dict(sorted_lines)
     
+    def fetch_odds_response(self,
+                            sport: str, 
+                            event_id: str,
+                            market: Union[str, List[str]]) -> Tuple[Union[Dict, None], Union[Tuple[str, str], None]]: 
+        market_string = ','.join(market) if isinstance(market, (list, tuple)) else market
+
+        if self.cache_ttl is not None:
+            cache_key = hashlib.sha1(f'{sport}|{event_id}|{market_string}|{self.region}|{self.odds_format}|{self.date_format}'.encode()).hexdigest()
+            cached_response = self.read_cached_response(cache_key, max_age = self.cache_ttl)
+            if cached_response is not None:
+                self.latest_ran_markets = market
+                return cached_response, None
+
+        odds_response = self.send_request(
+            f'{self.source}/{sport}/events/{event_id}/odds',
+            params = self._base_params | {'markets': market_string}
+        )
+        if odds_response.status_code != 200:
+            print(f'Failed to get sports: status_code {odds_response.status_code}, response body {odds_response.text}')
+            if self.cache_ttl is not None and self.cache_stale_on_error:
+                stale_response = self.read_cached_response(cache_key, keep_in_memory = False)
+                if stale_response is not None:
+                    print(f'Using the last cached odds for {event_id}')
+                    self.latest_ran_markets = market
+                    return stale_response, None
+            return None, None
+        else: 
+            self.latest_ran_markets = market 
+            
+            odds_response_json = json_loads(odds_response.content)
+            if self.cache_ttl is not None:
+                self.write_cached_response(cache_key, odds_response_json)
+            return odds_response_json, read_api_tokens(odds_response)
+
     def get_odds(self,
                  sport: str, 
                  event_id: str,
                  market: Union[str, List[str]]) -> Union[Dict, None]: 
-            if type(market) == list: 
-                market_string = ','.join(market)
-            else: 
-                market_string = market
-            url_link = f'https://api.the-odds-api.com/v4/sports/{sport}/events/{event_id}/odds?apiKey={self.api_key}&markets={market_string}'
-            odds_response = requests.get(
-                url_link,
-                params={
-                    'api_key': self.api_key,
-                    'regions': self.region,
-                    'oddsFormat': self.odds_format,
-                    'dateFormat': self.date_format,
-                }
-            )
-            if odds_response.status_code != 200:
-                print(f'Failed to get sports: status_code {odds_response.status_code}, response body {odds_response.text}')
-            else: 
-                self.api_tokens_left = odds_response.headers['x-requests-remaining']
-                self.api_tokens_used = odds_response.headers['x-requests-used']
-                self.latest_ran_markets = market 
-                
-                return self.output_game_odds(odds_response = odds_response.json())
+            odds_response_json, api_tokens = self.fetch_odds_response(sport = sport, 
+                                                                      event_id = event_id, 
+                                                                      market = market)
+            self.update_api_tokens([api_tokens])
+            if odds_response_json is not None:
+                return self.output_game_odds(odds_response = odds_response_json)
+
+    def get_odds_batch(self,
+                       sport: str, 
+                       event_ids: List[str],
+                       market: Union[str, List[str]],
+                       max_workers = 16) -> Dict[str, Union[Dict, None]]:
+        """Fetches the odds for several events concurrently over the shared session.
+
+        Only the HTTP round-trips run on the thread pool; the responses are parsed sequentially
+        so the `latest_ran_*` attributes end up describing the last event in `event_ids`.
+        """
+        market = ','.join(market) if isinstance(market, (list, tuple)) else market
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            odds_responses = list(executor.map(lambda event_id: self.fetch_odds_response(sport = sport, 
+                                                                                         event_id = event_id, 
+                                                                                         market = market), 
+                                               event_ids))
+        
+        return self.output_game_odds_batch(event_ids, odds_responses)
+
+    async def get_odds_many(self,
+                            sport: str, 
+                            event_ids: List[str],
+                            market: Union[str, List[str]],
+                            concurrency = 16) -> Dict[str, Union[Dict, None]]:
+        """Awaitable counterpart of `get_odds_batch` for callers that already run an event loop.
+
+        The blocking requests are handed to worker threads, at most `concurrency` at a time,
+        so the event loop is never held up by a network round-trip.
+        """
+        market = ','.join(market) if isinstance(market, (list, tuple)) else market
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(event_id: str) -> Union[Dict, None]:
+            async with semaphore:
+                return await asyncio.to_thread(self.fetch_odds_response, 
+                                               sport = sport, 
+                                               event_id = event_id, 
+                                               market = market)
+
+        odds_responses = await asyncio.gather(*(fetch(event_id) for event_id in event_ids))
+
+        return self.output_game_odds_batch(event_ids, odds_responses)
+
+    def output_game_odds_batch(self,
+                               event_ids: List[str],
+                               odds_responses: List[Tuple[Union[Dict, None], Union[Tuple[str, str], None]]]) -> Dict[str, Union[Dict, None]]:
+        odds_collections = {}
+        for event_id, (odds_response_json, _) in zip(event_ids, odds_responses):
+            odds_collections[event_id] = self.output_game_odds(odds_response = odds_response_json) if odds_response_json is not None else None
+        self.update_api_tokens([api_tokens for _, api_tokens in odds_responses])
+        
+        return odds_collections
                 
+    def fetch_historical_odds_response(self,
+                                       sport: str, 
+                                       event_id: str,
+                                       market: Union[str, List[str]],
+                                       datestr: str) -> Tuple[Union[Dict, None], Union[Tuple[str, str], None]]: 
+        market_string = ','.join(market) if isinstance(market, (list, tuple)) else market
+
+        return self.fetch_historical_response(
+            f'{historical_api_source}/{sport}/events/{event_id}/odds',
+            params = self._historical_base_params | {'date': datestr, 'markets': market_string})
+
     def get_historical_odds(self, 
                         sport: str, 
                         event_id: str,
                         market: Union[str, List[str]],
                         datestr: str) -> Union[Dict, None]: 
-        
-        if type(market) == list: 
-            market_string = ','.join(market)
-        else: 
-            market_string = market
-            
-        historical_url_request = f'https://api.the-odds-api.com/v4/historical/sports/{sport}/events/{event_id}/odds?apiKey={self.api_key}&date={datestr}&regions={self.region}&markets={market_string}'
-        odds_response = requests.get(
-                historical_url_request,
-                params={
-                    'oddsFormat': self.odds_format
-                })
-        if odds_response.status_code != 200:
-                print(f'Failed to get sports: status_code {odds_response.status_code}, response body {odds_response.text}')
-        else: 
-            self.historical_event_previous_timestamp = odds_response.json()['timestamp']
-            self.historical_event_recently_ran_timestamp = odds_response.json()['previous_timestamp']
-            self.historical_event_next_timestamp = odds_response.json()['next_timestamp']
+        odds_response_json, api_tokens = self.fetch_historical_odds_response(sport = sport, 
+                                                                             event_id = event_id, 
+                                                                             market = market, 
+                                                                             datestr = datestr)
+        self.update_api_tokens([api_tokens])
+        return self.output_historical_game_odds(odds_response_json, market = market)
+
+    def output_historical_game_odds(self,
+                                    odds_response_json: Union[Dict, None],
+                                    market: Union[str, List[str]]) -> Union[Dict, None]:
+        if odds_response_json is not None: 
+            self.historical_event_previous_timestamp = odds_response_json['timestamp']
+            self.historical_event_recently_ran_timestamp = odds_response_json['previous_timestamp']
+            self.historical_event_next_timestamp = odds_response_json['next_timestamp']
             self.latest_ran_markets = market 
-
-            self.api_tokens_left = odds_response.headers['x-requests-remaining']
-            self.api_tokens_used = odds_response.headers['x-requests-used']
             
-            return self.output_game_odds(odds_response = odds_response.json()['data'])
+            return self.output_game_odds(odds_response = odds_response_json['data'])
             
     def output_odds_csv(self,
                         odds_dict: Dict,
                        ) -> pd.DataFrame:
         
-        default_column_set = ['event_id','home_team' , 'away_team', 'sportbook', 'event',
-                              'event_type_counterpart', 'event_type', 'event_date',
-                              'last_updated_at', 'odds', 'no_vig_prob']
-
-        info_columns = ['index','event_id', 'home_team', 'away_team', 
-                        'event', 'event_type', 'event_date', 
-                        'event_type_counterpart', 'last_updated_at']
-        
-        agg_dict = {}
+        # the table is gathered column by column, row_index maps each (sportsbook, event, event type) line to its row position
+        row_index = {}
+        sportsbooks = []
+        events = []
+        event_types = []
+        counterpart_events = []
+        last_updated_times = []
+        line_odds = []
+        # counterpart pairs are collected as two flat lists of row positions so the no vig probabilities are computed in a single vectorized call
+        pair_rows = []
+        pair_counter_rows = []
+        event_id = self.latest_ran_event_id
+        home_team = self.latest_ran_home_team
+        away_team = self.latest_ran_away_team
+        commence_time = self.latest_ran_commence_time
         for key, value in odds_dict.items():
             last_updated = value['last_updated_at']
             for sportsbook, odds in value['lines'].items():
-                bet_counter = 0
-                for bet_type, odd in odds.items():
+                for position, (bet_type, odd) in enumerate(odds.items()):
                     counter_event = get_counter_event_name(bet_type, 
-                                                           home_team = self.latest_ran_home_team, 
-                                                           away_team = self.latest_ran_away_team)
-                    event_unique_id = f'{self.latest_ran_event_id}_{sportsbook}_{key}_{bet_type}_{last_updated}'
-                    counter_event_unique_id = f'{self.latest_ran_event_id}_{sportsbook}_{key}_{counter_event}_{last_updated}'
-                    row = {
-                        'event_id': self.latest_ran_event_id,
-                        'home_team': self.latest_ran_home_team,
-                        'away_team': self.latest_ran_away_team,
-                        'sportbook': sportsbook,
-                        'event': key,
-                        'event_type': bet_type, 
-                        'event_type_counterpart': counter_event,
-                        'event_date': self.latest_ran_commence_time,
-                        'last_updated_at': last_updated,
-                        'odds': odd,
-                        'no_vig_prob': None
-                    }
-                    agg_dict[event_unique_id] = row
-                    if bet_counter > 0: 
-                        if counter_event_unique_id in agg_dict: 
-                            odd_1, odd_2 = compute_no_vig_probabilities(agg_dict[event_unique_id]['odds'],
-                                                                        agg_dict[counter_event_unique_id]['odds'])
-                            agg_dict[event_unique_id]['no_vig_prob'] = odd_1
-                            agg_dict[counter_event_unique_id]['no_vig_prob'] = odd_2
-                        
-                    bet_counter+=1
+                                                           home_team = home_team, 
+                                                           away_team = away_team)
+                    row_index[(sportsbook, key, bet_type)] = len(line_odds)
+                    sportsbooks.append(sportsbook)
+                    events.append(key)
+                    event_types.append(bet_type)
+                    counterpart_events.append(counter_event)
+                    last_updated_times.append(last_updated)
+                    line_odds.append(odd)
+                    # the first line of a sportsbook has nothing before it to pair with, so its counterpart is never looked up
+                    if position > 0: 
+                        counter_row = row_index.get((sportsbook, key, counter_event))
+                        if counter_row is not None: 
+                            pair_rows.append(len(line_odds) - 1)
+                            pair_counter_rows.append(counter_row)
+
+        line_odds = np.asarray(line_odds, dtype=np.float64)
+        pair_rows = np.asarray(pair_rows, dtype=np.intp)
+        pair_counter_rows = np.asarray(pair_counter_rows, dtype=np.intp)
+        no_vig_probs_1, no_vig_probs_2 = compute_no_vig_probabilities(line_odds[pair_rows], line_odds[pair_counter_rows])
+        # lines without a counterpart keep a no vig probability of 0, a line written by several pairs keeps the last pair's value
+        scatter_rows = np.column_stack((pair_rows, pair_counter_rows)).reshape(-1)
+        scatter_probs = np.column_stack((no_vig_probs_1, no_vig_probs_2)).reshape(-1)
+        _, last_writes = np.unique(scatter_rows[::-1], return_index = True)
+        last_writes = len(scatter_rows) - 1 - last_writes
+        no_vig_probs = np.zeros(len(line_odds), dtype=np.float64)
+        no_vig_probs[scatter_rows[last_writes]] = scatter_probs[last_writes]
                     
-        odds_df = pd.DataFrame.from_dict(agg_dict, orient='index').reset_index()
+        odds_df = pd.DataFrame({
+            'sportbook': sportsbooks,
+            'event': events,
+            'event_type': event_types,
+            'event_type_counterpart': counterpart_events,
+            'last_updated_at': last_updated_times,
+            'odds': line_odds,
+            'no_vig_prob': no_vig_probs
+        })
+        # the event level fields are identical on every row, so they are broadcast rather than repeated per line
+        odds_df['event_id'] = event_id
+        odds_df['home_team'] = home_team
+        odds_df['away_team'] = away_team
+        odds_df['event_date'] = commence_time
         odds_df['event_type_counterpart'] = odds_df['event_type_counterpart'].fillna('Not Available')
-        odds_df['no_vig_prob'] = odds_df['no_vig_prob'].fillna(0)
-
-        odds_df = odds_df.pivot_table(
-            index=['event_id', 'home_team', 'away_team', 'event', 'event_type', 
-                   'event_type_counterpart', 'event_date', 'last_updated_at'],
-            columns= 'sportbook',
-            values=["odds", "no_vig_prob"]).reset_index()
-        
-        odds_df['avg_odds'] =  odds_df['odds'].mean(axis = 1)
-        odds_df['best_odds'] = odds_df['odds'].max(axis = 1)
-        odds_df['sportsbook_w_best_odds'] = odds_df['odds'].idxmax(axis = 1)
-        odds_df['avg_no_vig_odds'] = odds_df['no_vig_prob'].mean(axis = 1 )
-        odds_df['num_sportsbooks'] = odds_df['odds'].notnull().sum(axis = 1)
 
-        odds_df = odds_df.drop('no_vig_prob', axis = 1)
+        info_columns = ['event_id', 'home_team', 'away_team', 'event', 'event_type', 
+                        'event_type_counterpart', 'event_date', 'last_updated_at']
+        odds_df = odds_df.set_index(info_columns + ['sportbook'])
+        odds_df = odds_df[['odds', 'no_vig_prob']].unstack('sportbook')
         
-        odds_df.columns = odds_df.columns.map(lambda x: f"{x[1]}" if x[1] else x[0])
-
-        odds_df['min_odds_needed_positive_ev'] = odds_df['avg_no_vig_odds'].apply(compute_positive_ev_odds)
-
-        odds_df['ev_pct']= odds_df.apply(lambda x: compute_expected_return(x['best_odds'], x['avg_no_vig_odds']), 
-                                         axis = 1)
+        # only the no vig row averages are needed
+        no_vig_values = odds_df['no_vig_prob'].to_numpy(dtype=np.float64)
+        sportsbook_odds = odds_df['odds']
+        sportsbook_names = sportsbook_odds.columns.to_numpy()
+        odds_values = sportsbook_odds.to_numpy(dtype=np.float64)
+        odds_df = sportsbook_odds.rename_axis(columns = None).reset_index()
+
+        best_odds = np.nanmax(odds_values, axis = 1)
+        avg_no_vig_odds = np.nanmean(no_vig_values, axis = 1)
+        odds_df['avg_odds'] = np.nanmean(odds_values, axis = 1)
+        odds_df['best_odds'] = best_odds
+        odds_df['sportsbook_w_best_odds'] = sportsbook_names[np.nanargmax(odds_values, axis = 1)]
+        odds_df['avg_no_vig_odds'] = avg_no_vig_odds
+        odds_df['num_sportsbooks'] = np.count_nonzero(~np.isnan(odds_values), axis = 1)
+
+        odds_df['min_odds_needed_positive_ev'] = compute_positive_ev_odds(avg_no_vig_odds)
+        odds_df['ev_pct'] = compute_expected_return(best_odds, avg_no_vig_odds)
         self.latest_ran_df = odds_df
         self.latest_ran_timestamp = last_updated
 
         return odds_df
 
     def compute_arbitrage_opps(self, odds_df: pd.DataFrame) ->  pd.DataFrame:
-        counterpart_odds = odds_df.copy()
-        counterpart_odds = counterpart_odds[['event','event_type', 'best_odds',
-                                              'sportsbook_w_best_odds']].rename(columns = {'event_type': 'event_type_counterpart', 
+        counterpart_odds = odds_df[['event','event_type', 'best_odds',
+                                    'sportsbook_w_best_odds']].rename(columns = {'event_type': 'event_type_counterpart', 
                                                                                            'best_odds': 'counterpart_event_best_odds',
                                                                                            'sportsbook_w_best_odds': 'counterpart_sportsbook_w_best_odds'})
         
-        odds_df = odds_df.set_index(['event', 
-                                     'event_type_counterpart']).join(counterpart_odds.set_index(['event', 
-                                                                                                 'event_type_counterpart']), how = 'left').reset_index()
-
+        odds_df = odds_df.merge(counterpart_odds, how = 'left', on = ['event', 'event_type_counterpart'])
 
-        odds_df['arbitrage_ind'] =  odds_df[['best_odds','counterpart_event_best_odds']].apply(lambda x: determin_arbitrage_opps(x['best_odds'], 
-                                                                                                                                 x['counterpart_event_best_odds']),
-                                                                                               axis = 1)
+        odds_df['arbitrage_ind'] = determin_arbitrage_opps(odds_df['best_odds'].to_numpy(dtype=np.float64), 
+                                                           odds_df['counterpart_event_best_odds'].to_numpy(dtype=np.float64))
         self.latest_ran_df = odds_df
         return odds_df
 
@@ -337,9 +632,9 @@ class OddsAPI:
         odds_dataframe = self.output_odds_csv(odds_collection)
         odds_dataframe = self.compute_arbitrage_opps(odds_dataframe)
 
-        positive_ev = odds_dataframe[(odds_dataframe.ev_pct > 0)]
+        positive_ev = odds_dataframe[odds_dataframe['ev_pct'].to_numpy() > 0]
         
-        arb_df = odds_dataframe[odds_dataframe.arbitrage_ind == True]
+        arb_df = odds_dataframe[odds_dataframe['arbitrage_ind'].to_numpy()]
         # If no Positive EV opps are found, no arbitrage will be found 
         if positive_ev.shape[0] == 0:
             print(f'No positive EV opportunities identified for event {event_id}')
@@ -357,7 +652,8 @@ class OddsAPI:
                      date = None, 
                      hour_of_day = None,
                      get_event_prior_to_commence = False,
-                     custoff_date = None) -> Union[pd.DataFrame, None]:
+                     custoff_date = None,
+                     max_workers = 8) -> Union[pd.DataFrame, None]:
         df_list = []
         if historical_event:
             if not date: 
@@ -368,49 +664,50 @@ class OddsAPI:
                 date = date, 
                 hour_of_day = hour_of_day)
             
+            ran_time = datetime.datetime.fromisoformat(self.latest_historical_ran_time.rstrip('Z'))
+            datestr = self.latest_historical_ran_time
+            event_ids = []
             for event_id, value in historical_matches.items():
-                commence_time = value['commence_time']
-                fmt = "%Y-%m-%dT%H:%M:%SZ"
-                commence_time = datetime.datetime.strptime(commence_time , fmt)
-                ran_time = datetime.datetime.strptime(self.latest_historical_ran_time, fmt)
                 if get_event_prior_to_commence:
-                    if ran_time <= commence_time and commence_time < custoff_date: 
-
-                        print(f'Collecting historical odds for {event_id} at {self.latest_historical_ran_time}')
-        
-                        odds_collection = self.get_historical_odds(
-                            sport = sport, 
-                            event_id = event_id,
-                            market = market,
-                            datestr = self.latest_historical_ran_time
-                        )
-                    
-                        output_df = self.output_odds_csv(odds_collection)
-                        df_list.append(output_df)
-                else: 
-                    print(f'Collecting historical odds for {event_id} at {self.latest_historical_ran_time}')
-        
-                    odds_collection = self.get_historical_odds(
-                        sport = sport, 
-                        event_id = event_id,
-                        market = market,
-                        datestr = self.latest_historical_ran_time
-                    )
-                
+                    commence_time = datetime.datetime.fromisoformat(value['commence_time'].rstrip('Z'))
+                    if not (ran_time <= commence_time and commence_time < custoff_date): 
+                        continue
+                event_ids.append(event_id)
+
+            # the snapshots for every event are requested concurrently, each response is parsed on this thread as it arrives, in event order
+            api_tokens = []
+            with ThreadPoolExecutor(max_workers = max_workers) as executor:
+                odds_responses = executor.map(lambda event_id: self.fetch_historical_odds_response(sport = sport, 
+                                                                                                   event_id = event_id, 
+                                                                                                   market = market, 
+                                                                                                   datestr = datestr), 
+                                              event_ids)
+                for event_id, (odds_response_json, event_api_tokens) in zip(event_ids, odds_responses):
+                    print(f'Collecting historical odds for {event_id} at {datestr}')
+                    api_tokens.append(event_api_tokens)
+                    odds_collection = self.output_historical_game_odds(odds_response_json, market = market)
                     output_df = self.output_odds_csv(odds_collection)
                     df_list.append(output_df)
+            self.update_api_tokens(api_tokens)
         else: 
             
             upcoming_matches = self.get_upcoming_matches(sport = sport)
+            event_ids = list(upcoming_matches.keys())
             
-            for event_id in upcoming_matches.keys():
-                print(f'Collecting odds for {event_id} at {self.latest_ran_timestamp}')
-                odds_collection = self.get_odds(
-                        sport = sport, 
-                        event_id = event_id,
-                        market = market)
-                output_df = self.output_odds_csv(odds_collection)
-                df_list.append(output_df)
+            # the odds for every event are requested concurrently, each response is parsed on this thread as it arrives, in event order
+            api_tokens = []
+            with ThreadPoolExecutor(max_workers = max_workers) as executor:
+                odds_responses = executor.map(lambda event_id: self.fetch_odds_response(sport = sport, 
+                                                                                        event_id = event_id, 
+                                                                                        market = market), 
+                                              event_ids)
+                for event_id, (odds_response_json, event_api_tokens) in zip(event_ids, odds_responses):
+                    print(f'Collecting odds for {event_id} at {self.latest_ran_timestamp}')
+                    api_tokens.append(event_api_tokens)
+                    odds_collection = self.output_game_odds(odds_response = odds_response_json) if odds_response_json is not None else None
+                    output_df = self.output_odds_csv(odds_collection)
+                    df_list.append(output_df)
+            self.update_api_tokens(api_tokens)
         
         if df_list: 
             
@@ -426,8 +723,18 @@ class OddsAPI:
                                                 date = str, 
                                                 hour_of_day = '12:00:00',
                                                 interval_min = 60,
-                                                dir = home_dir
+                                                dir = home_dir,
+                                                output_format = 'csv'
                                                ) -> None:
+        """Saves the odds of every event for each snapshot of the day.
+
+        `output_format` is either 'csv' or 'parquet' (zstd compressed); parquet is faster to write
+        and smaller on disk but needs the optional pyarrow dependency, which is checked before any request is sent.
+        """
+        if output_format not in ('csv', 'parquet'):
+            raise ValueError("`output_format` must be either 'csv' or 'parquet'")
+        if output_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+            raise ImportError("`output_format='parquet'` requires pyarrow, install it with `pip install pyarrow`")
 
         fmt = "%Y-%m-%dT%H:%M:%SZ"
         datetime_str = f'{date}T{hour_of_day}Z'
@@ -452,9 +759,12 @@ class OddsAPI:
         
         date_part = date 
         while historcal_df is not None:
-            csv_name = f'{sport}_{date_part}_{datetime_str}.csv'
-            print(f'Saving {csv_name} to local')
-            historcal_df.to_csv(home_dir / sport / f'{sport}_{date}' / csv_name, index=False)
+            file_name = f'{sport}_{date_part}_{datetime_str}.{output_format}'
+            print(f'Saving {file_name} to local')
+            if output_format == 'parquet':
+                historcal_df.to_parquet(home_dir / sport / f'{sport}_{date}' / file_name, engine='pyarrow', compression='zstd', index=False)
+            else:
+                historcal_df.to_csv(home_dir / sport / f'{sport}_{date}' / file_name, index=False)
             datetime_var = datetime_var + datetime.timedelta(minutes = interval_min) 
             datetime_str = datetime_var.strftime("%Y-%m-%dT%H:%M:%SZ")
 